@@ -4,8 +4,66 @@ Creates intelligent chunks that preserve context and meaning
 """
 
 import json
+import os
 import re
-from typing import List, Dict
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Optional
+
+# ============================================
+# PATTERNS
+# ============================================
+
+# Section headers (topics commonly found in biographies), checked in this order
+SECTION_MARKERS = [
+    'name and lineage',
+    'her marriage',
+    'her life with',
+    'her emigration',
+    'her death',
+    'her virtues',
+    'embracing islam',
+    'her childhood',
+    'her upbringing',
+    'her knowledge',
+    'wisdom behind',
+    'her contributions',
+    'her generosity',
+    'battle of',
+    'her worship',
+    'her piety',
+    'criteria for',
+    'the wisdom',
+    'her father',
+    'her mother'
+]
+
+# Phrases that introduce a wife's alias
+ALIAS_TRIGGERS = ['also known as', 'nicknamed', 'called', 'dubbed']
+
+# Pattern: "umm al-muminin NAME bint FATHER_NAME"
+NAME_PATTERN = re.compile(
+    r'umm al-muminin\s+([a-z]+(?:\s+bint\s+[a-z]+(?:\s+[a-z]+)?)?)'
+)
+
+def compile_marker_pattern(markers: List[str]) -> re.Pattern:
+    """
+    Build one anchored alternation regex for all section markers
+    Alternation is tried left to right, so the first listed marker still wins
+    """
+    alternation = '|'.join(re.escape(m) for m in markers)
+    return re.compile(rf'(?:{alternation})', re.IGNORECASE)
+
+def compile_alias_patterns(triggers: List[str]) -> List[re.Pattern]:
+    """
+    Build one compiled regex per trigger phrase
+    Kept separate (not one alternation) so matches behave exactly like
+    independent findall passes: "nicknamed called humayra" yields both
+    "called humayra" and "humayra", but "called called humayra" only the first
+    """
+    return [
+        re.compile(rf'{re.escape(t)}[:\s]+([a-z\s]{{3,20}})(?:[,\.]|$)')
+        for t in triggers
+    ]
 
 # ============================================
 # SEMANTIC CHUNKER CLASS
@@ -14,20 +72,28 @@ from typing import List, Dict
 class SemanticChunker:
     """Creates semantically meaningful chunks from wife biographies"""
     
-    def __init__(self, max_chunk_size=800, min_chunk_size=400):
+    def __init__(self, max_chunk_size=800, min_chunk_size=400,
+                 extra_markers: Optional[List[str]] = None):
         """
         Initialize chunker with size constraints
         
         Args:
             max_chunk_size: Maximum characters per chunk (default: 800)
             min_chunk_size: Minimum characters per chunk (default: 400)
+            extra_markers: Additional section headers, checked after SECTION_MARKERS
         """
         self.max_chunk_size = max_chunk_size
         self.min_chunk_size = min_chunk_size
+        self.section_markers = SECTION_MARKERS + [m.lower() for m in (extra_markers or [])]
+        
+        # Compile once, reused for every paragraph and chapter
+        self.marker_pattern = compile_marker_pattern(self.section_markers)
+        self.alias_patterns = compile_alias_patterns(ALIAS_TRIGGERS)
         
         print(f"✅ Chunker initialized:")
         print(f"   - Max chunk size: {max_chunk_size} chars (~{max_chunk_size//6} words)")
         print(f"   - Min chunk size: {min_chunk_size} chars (~{min_chunk_size//6} words)")
+        print(f"   - Section markers: {len(self.section_markers)}")
     
     def extract_wife_info(self, text: str) -> Dict:
         """
@@ -37,26 +103,17 @@ class SemanticChunker:
         wife_name = None
         aliases = []
         
+        # Lowercase the chapter once for both patterns
+        text_lower = text.lower()
+        
         # IMPROVED: Better pattern to capture full name including 3 parts
-        # Pattern: "umm al-muminin NAME bint FATHER_NAME"
-        name_match = re.search(
-            r'umm al-muminin\s+([a-z]+(?:\s+bint\s+[a-z]+(?:\s+[a-z]+)?)?)',
-            text.lower()
-        )
+        name_match = NAME_PATTERN.search(text_lower)
         if name_match:
             wife_name = name_match.group(1).title()
         
         # IMPROVED: Better alias extraction (only short names, not sentences)
-        alias_patterns = [
-            r'also known as[:\s]+([a-z\s]{3,20})(?:[,\.]|$)',
-            r'nicknamed[:\s]+([a-z\s]{3,20})(?:[,\.]|$)',
-            r'called[:\s]+([a-z\s]{3,20})(?:[,\.]|$)',
-            r'dubbed[:\s]+([a-z\s]{3,20})(?:[,\.]|$)',
-        ]
-        
-        for pattern in alias_patterns:
-            matches = re.findall(pattern, text.lower())
-            for match in matches:
+        for pattern in self.alias_patterns:
+            for match in pattern.findall(text_lower):
                 # Clean and validate alias
                 alias = match.strip()
                 # Only keep if it's a reasonable name (3-20 chars, mostly letters)
@@ -65,7 +122,7 @@ class SemanticChunker:
         
         return {
             'wife_name': wife_name,
-            'aliases': list(set(aliases))  # Remove duplicates
+            'aliases': list(dict.fromkeys(aliases))  # Remove duplicates, keep first-seen order
         }
     
     def split_into_sections(self, text: str) -> List[Dict]:
@@ -75,30 +132,6 @@ class SemanticChunker:
         """
         sections = []
         
-        # Define section headers (topics commonly found in biographies)
-        section_markers = [
-            'name and lineage',
-            'her marriage',
-            'her life with',
-            'her emigration',
-            'her death',
-            'her virtues',
-            'embracing islam',
-            'her childhood',
-            'her upbringing',
-            'her knowledge',
-            'wisdom behind',
-            'her contributions',
-            'her generosity',
-            'battle of',
-            'her worship',
-            'her piety',
-            'criteria for',
-            'the wisdom',
-            'her father',
-            'her mother'
-        ]
-        
         # Split by double newlines (paragraphs)
         paragraphs = [p.strip() for p in text.split('\n') if p.strip()]
         
@@ -108,25 +141,20 @@ class SemanticChunker:
         }
         
         for para in paragraphs:
-            # Check if paragraph starts a new section
-            para_lower = para.lower()
-            is_new_section = False
-            
-            for marker in section_markers:
-                if para_lower.startswith(marker):
-                    # Save previous section if it has content
-                    if current_section['content']:
-                        sections.append(current_section)
-                    
-                    # Start new section
-                    current_section = {
-                        'title': marker.title(),
-                        'content': [para]
-                    }
-                    is_new_section = True
-                    break
+            # Check if paragraph starts a new section (one regex for all markers)
+            marker_match = self.marker_pattern.match(para)
             
-            if not is_new_section:
+            if marker_match:
+                # Save previous section if it has content
+                if current_section['content']:
+                    sections.append(current_section)
+                
+                # Start new section
+                current_section = {
+                    'title': marker_match.group(0).lower().title(),
+                    'content': [para]
+                }
+            else:
                 current_section['content'].append(para)
         
         # Add last section
@@ -217,13 +245,32 @@ class SemanticChunker:
 # PROCESSING FUNCTION
 # ============================================
 
-def process_chapters(input_file: str, output_file: str):
+def chunk_chapters(chunker: SemanticChunker, chapters: List[str], workers: int = 1) -> List[List[Dict]]:
+    """
+    Chunk every chapter, optionally across a process pool
+    
+    Results are always returned in chapter order, so the output file is
+    identical whatever the number of workers.
+    """
+    if workers <= 1 or len(chapters) <= 1:
+        return [chunker.create_chunks(chapter) for chapter in chapters]
+    
+    workers = min(workers, len(chapters))
+    # Hand each worker a few chapters at a time to keep pickling overhead low
+    chunksize = max(1, len(chapters) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(chunker.create_chunks, chapters, chunksize=chunksize))
+
+def process_chapters(input_file: str, output_file: str, workers: int = 1,
+                     extra_markers: Optional[List[str]] = None):
     """
     Process chapter-wise data into semantic chunks
     
     Args:
         input_file: Path to chpWise.json
         output_file: Path to save semantic_chunks.json
+        workers: Number of processes used for chunking (default: 1, sequential)
+        extra_markers: Additional section headers passed to the chunker
     """
     
     print("\n" + "="*70)
@@ -245,26 +292,18 @@ def process_chapters(input_file: str, output_file: str):
     
     # Initialize chunker
     print("\n🔧 Initializing semantic chunker...")
-    chunker = SemanticChunker(max_chunk_size=800, min_chunk_size=400)
+    chunker = SemanticChunker(max_chunk_size=800, min_chunk_size=400, extra_markers=extra_markers)
     
     # Process each chapter
-    print("\n✂️  Creating semantic chunks...")
+    print(f"\n✂️  Creating semantic chunks ({workers} worker{'s' if workers != 1 else ''})...")
     print("-" * 70)
     
     all_chunks = []
-    wife_chunk_counts = {}
     
-    for i, chapter in enumerate(chapters, 1):
-        print(f"\n📖 Processing chapter {i}/{len(chapters)}...")
-        
-        chapter_chunks = chunker.create_chunks(chapter)
+    for chapter_chunks in chunk_chapters(chunker, chapters, workers):
         all_chunks.extend(chapter_chunks)
-        
-        # Track chunks per wife
-        if chapter_chunks:
-            wife_name = chapter_chunks[0]['wife_name']
-            wife_chunk_counts[wife_name] = len(chapter_chunks)
-            print(f"   ✅ Created {len(chapter_chunks)} chunks for {wife_name}")
+    
+    print(f"   ✅ Created {len(all_chunks)} chunks from {len(chapters)} chapters")
     
     # POST-PROCESSING: Fix "Unknown" and incomplete names
     print("\n🔧 Post-processing: Fixing incomplete names...")
@@ -373,7 +412,8 @@ if __name__ == "__main__":
     # Run chunking process
     chunks = process_chapters(
         input_file='chpWise.json',
-        output_file='semantic_chunks.json'
+        output_file='semantic_chunks.json',
+        workers=os.cpu_count() or 1
     )
     
     print("\n🎉 Done! Check 'semantic_chunks.json' to see the results.")
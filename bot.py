@@ -1,26 +1,76 @@
-# bot.py (Updated with Message Splitting Logic)
+# bot.py
 
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 import asyncio 
 
-from config import DISCORD_TOKEN
-from retrieval import perform_rag_retrieval
+from config import (
+    DISCORD_TOKEN, KB_WATCH_INTERVAL, WARMUP_MAX_QUERIES, WARMUP_INTERVAL_HOURS
+)
+from retrieval import perform_rag_retrieval, reload_data, knowledge_base_changed
+from warmup import log_query, run_warmup
+from delivery import MessageDispatcher
 
 # --- Discord Bot Setup ---
 intents = discord.Intents.default()
 intents.message_content = True 
 bot = commands.Bot(command_prefix='!', intents=intents)
+dispatcher = MessageDispatcher()
+# on_ready fires again after a reconnect; warm-up is only set up once
+_warmup_started = False
 
 @bot.event
 async def on_ready():
     """Prints a message when the bot successfully connects to Discord."""
+    global _warmup_started
     print(f'Bot connected as {bot.user} (ID: {bot.user.id})')
+    if KB_WATCH_INTERVAL > 0 and not watch_knowledge_base.is_running():
+        watch_knowledge_base.change_interval(seconds=KB_WATCH_INTERVAL)
+        watch_knowledge_base.start()
+    if WARMUP_MAX_QUERIES > 0 and not _warmup_started:
+        _warmup_started = True
+        if WARMUP_INTERVAL_HOURS > 0:
+            warm_caches.change_interval(hours=WARMUP_INTERVAL_HOURS)
+            warm_caches.start()
+        else:
+            # Startup only: run once in the background, no schedule
+            bot.loop.run_in_executor(None, run_warmup)
+
+@tasks.loop(hours=6)
+async def warm_caches():
+    """Pre-computes embeddings/retrieval for the most common logged questions."""
+    await bot.loop.run_in_executor(None, run_warmup)
+
+@tasks.loop(seconds=60)
+async def watch_knowledge_base():
+    """Reloads the knowledge base in the background when the joblib file changes on disk."""
+    if knowledge_base_changed():
+        _, message = await bot.loop.run_in_executor(None, reload_data)
+        print(f"[KB Watcher] {message}")
+
+@bot.command(name='reload')
+@commands.has_permissions(administrator=True)
+async def reload_knowledge_base(ctx):
+    """Admin-only: rebuilds the knowledge base and swaps it in without a restart."""
+    await ctx.send("Reloading the knowledge base...")
+    # Build off the event loop so live queries keep being served meanwhile
+    _, message = await bot.loop.run_in_executor(None, reload_data)
+    await ctx.send(message)
+
+@reload_knowledge_base.error
+async def reload_knowledge_base_error(ctx, error):
+    if isinstance(error, commands.MissingPermissions):
+        await ctx.send("Only server administrators can reload the knowledge base.")
+    else:
+        raise error
 
 @bot.command(name='azwaj')
 async def azwaj_query(ctx, *, users_query: str):
     """Handles the RAG query for Ummul Momineen (Azwaj)."""
     
+    # Fire-and-forget: the log write must not delay the answer
+    bot.loop.run_in_executor(None, log_query, users_query)
+
     async with ctx.typing():
         try:
             # Run RAG process in executor
@@ -33,27 +83,9 @@ async def azwaj_query(ctx, *, users_query: str):
             print(f"An unexpected error occurred during RAG process: {e}")
             final_response = "An internal error occurred while trying to process your request."
         
-        # === START OF NEW LOGIC TO HANDLE 2000 CHARACTER LIMIT ===
-        MAX_CHARS = 2000
-        response_text = final_response
-
-        if len(response_text) > MAX_CHARS:
-            # Split the long response into chunks of max 2000 characters
-            # We use a simple method here, but for perfect paragraph/line breaks, 
-            # more complex logic (like discord.utils.fill_in_chunks) is needed.
-            chunks = [response_text[i:i + MAX_CHARS] for i in range(0, len(response_text), MAX_CHARS)]
-            
-            # Send each chunk separately
-            for i, chunk in enumerate(chunks):
-                if i == 0:
-                    # Add a header to the first chunk
-                    await ctx.send(f"**[Detailed Response - Part 1/{len(chunks)}]**\n{chunk}")
-                else:
-                    await ctx.send(f"**[Part {i+1}/{len(chunks)}]**\n{chunk}")
-        else:
-            # Send the response normally
-            await ctx.send(response_text)
-        # === END OF NEW LOGIC ===
+    # Split on natural boundaries and queue per channel; sending happens in the
+    # background so this handler is free for the next query right away
+    dispatcher.deliver(ctx.channel, final_response)
 
 if __name__ == "__main__":
     if DISCORD_TOKEN:
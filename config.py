@@ -14,6 +14,37 @@ JOB_LIB_PATH = "newJoblib.joblib"
 EMBEDDING_MODEL = "bge-m3"
 LLM_MODEL = "llama3.2"
 
+# --- Knowledge Base Hot Reload ---
+# Seconds between checks of JOB_LIB_PATH for a newer file (0 disables the watcher)
+KB_WATCH_INTERVAL = int(os.getenv("KB_WATCH_INTERVAL", "60"))
+
+# --- Query Caches & Warm-up ---
+QUERY_LOG_PATH = "query_log.jsonl"
+QUERY_CACHE_SIZE = 512
+# Cache final LLM answers too (off by default so answers stay fresh)
+CACHE_ANSWERS = os.getenv("CACHE_ANSWERS", "false").lower() in ("1", "true", "yes")
+WARMUP_MAX_QUERIES = int(os.getenv("WARMUP_MAX_QUERIES", "50"))   # 0 disables warm-up
+WARMUP_TIME_BUDGET = 120          # Seconds a single warm-up run may take
+WARMUP_CONCURRENCY = 2            # Parallel warm-up requests to Ollama
+WARMUP_INTERVAL_HOURS = 6         # Re-run warm-up on this schedule (0 = startup only)
+WARMUP_HALF_LIFE_DAYS = 7         # Recency weight: a question asked N half-lives ago counts 1/2^N
+
+# --- Generation Policy ---
+# Top similarity below this = not in the knowledge base, answered without the LLM
+MIN_SIMILARITY = float(os.getenv("MIN_SIMILARITY", "0.40"))
+LOW_CONFIDENCE_SIMILARITY = 0.50  # Below this, answers are kept shorter
+CLEAR_MARGIN = 0.08               # Top-1 vs top-2 gap that counts as a clear winner
+CLOSE_MARGIN = 0.02               # Gap below which top chunks are treated as a tie
+MAX_CONTEXT_CHUNKS = 5            # Chunks retrieved per query; the policy uses up to this many
+MAX_NUM_PREDICT = 400
+MAX_INFERENCE_TIMEOUT = 170       # Seconds, for a MAX_NUM_PREDICT generation
+MIN_INFERENCE_TIMEOUT = 60
+
+# --- Discord Delivery ---
+# Per-channel token bucket: Discord allows roughly 5 messages per 5 seconds per channel
+SEND_RATE_PER_SECOND = 1.0
+SEND_BURST = 5
+
 # Ensure URLs are correctly configured
 if not OLLAMA_GENERATE_URL or not OLLAMA_GENERATE_URL.endswith("/api/generate"):
     print("Warning: OLLAMA_URL in .env may be incorrect. Using default localhost.")
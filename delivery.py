@@ -0,0 +1,215 @@
+# delivery.py
+
+import asyncio
+import re
+import time
+
+import discord
+
+from config import SEND_RATE_PER_SECOND, SEND_BURST
+
+# --- Discord Limits ---
+MAX_MESSAGE_CHARS = 2000
+MAX_EMBEDS_PER_MESSAGE = 10
+MAX_EMBED_TOTAL_CHARS = 6000
+# Page size that lets two embeds (plus title/footer) share one message
+EMBED_PAGE_CHARS = (MAX_EMBED_TOTAL_CHARS - 100) // 2
+
+# Seconds a channel worker waits for new messages before shutting down
+WORKER_IDLE_TIMEOUT = 60
+
+# Split preference: paragraph, line, sentence, word
+_BREAK_PATTERNS = [
+    re.compile(r"\n\s*\n"),
+    re.compile(r"\n"),
+    re.compile(r"(?<=[.!?])\s+"),
+    re.compile(r"\s+"),
+]
+_FENCE_PATTERN = re.compile(r"^```([^\n]*)", re.MULTILINE)
+# Only a real language tag is carried over when a code block is reopened
+_FENCE_LANG_PATTERN = re.compile(r"[\w+#.-]{1,20}")
+_CODE_BLOCK_PATTERN = re.compile(r"```.*?(?:```|$)", re.DOTALL)
+# Room kept free for closing markdown ("\n```" and "**")
+_MARKDOWN_RESERVE = 6
+
+
+def _find_break(text, limit):
+    """Returns (start, end) of the best separator to cut text at within limit characters."""
+    window = text[:limit]
+    for pattern in _BREAK_PATTERNS:
+        cut = None
+        for match in pattern.finditer(window):
+            # Ignore breaks so early they would leave a tiny part
+            if match.start() > limit // 4:
+                cut = match
+        if cut is not None:
+            return cut.start(), cut.end()
+    return limit, limit
+
+
+def split_message(text, limit=MAX_MESSAGE_CHARS):
+    """
+    Splits text into parts of at most limit characters.
+
+    Cuts on paragraph, line, sentence or word boundaries (in that order of
+    preference). Code blocks and **bold** spans cut in two are closed at the
+    end of one part and reopened at the start of the next.
+    """
+    parts = []
+    prefix = ""
+    remaining = text.strip()
+
+    while remaining:
+        if len(prefix) + len(remaining) <= limit:
+            parts.append(prefix + remaining)
+            break
+
+        start, end = _find_break(remaining, limit - len(prefix) - _MARKDOWN_RESERVE)
+        part = prefix + remaining[:start].rstrip()
+        remaining = remaining[end:]
+        prefix = ""
+
+        fences = _FENCE_PATTERN.findall(part)
+        if len(fences) % 2:
+            # Odd number of fences: the last one opened a block that is still open.
+            # Reopen with just the fence and language, never the rest of that line
+            part += "\n```"
+            lang = fences[-1].strip()
+            prefix = "```" + (lang if _FENCE_LANG_PATTERN.fullmatch(lang) else "") + "\n"
+        elif _CODE_BLOCK_PATTERN.sub("", part).count("**") % 2:
+            part += "**"
+            prefix = "**"
+
+        parts.append(part)
+
+    return parts
+
+
+def build_messages(text, use_embeds=True):
+    """
+    Turns an answer into a list of (content, embeds) payloads.
+
+    Short answers stay a plain message. Longer ones become embed pages,
+    packed several to a message to keep the message count down, unless
+    use_embeds is False, in which case they are plain 2000-character parts.
+    """
+    text = text.strip() or "Sorry, I couldn't generate a response."
+    if len(text) <= MAX_MESSAGE_CHARS:
+        return [(text, [])]
+    if not use_embeds:
+        return [(part, []) for part in split_message(text, MAX_MESSAGE_CHARS)]
+
+    pages = split_message(text, EMBED_PAGE_CHARS)
+    embeds = []
+    for i, page in enumerate(pages, 1):
+        embed = discord.Embed(description=page, colour=discord.Colour.blurple())
+        if len(pages) > 1:
+            embed.set_footer(text=f"Part {i}/{len(pages)}")
+        embeds.append(embed)
+    embeds[0].title = "Detailed Response"
+
+    payloads = []
+    current = []
+    current_size = 0
+    for embed in embeds:
+        size = len(embed)
+        if current and (len(current) == MAX_EMBEDS_PER_MESSAGE or current_size + size > MAX_EMBED_TOTAL_CHARS):
+            payloads.append((None, current))
+            current = []
+            current_size = 0
+        current.append(embed)
+        current_size += size
+    payloads.append((None, current))
+    return payloads
+
+
+def can_embed(channel):
+    """True if the bot may send embeds in the channel (always allowed in DMs)."""
+    guild = getattr(channel, "guild", None)
+    if guild is None:
+        return True
+    return channel.permissions_for(guild.me).embed_links
+
+
+class TokenBucket:
+    """Allows bursts of `capacity` sends, refilled at `rate` tokens per second."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class MessageDispatcher:
+    """
+    Sends answers through one queue and token bucket per channel.
+
+    deliver() only enqueues, so the command handler returns right away;
+    a background worker per channel does the actual sending.
+    """
+
+    def __init__(self, rate=SEND_RATE_PER_SECOND, burst=SEND_BURST):
+        self.rate = rate
+        self.burst = burst
+        self._queues = {}
+        self._buckets = {}
+        # Strong references to the worker tasks so they are not garbage collected
+        self._workers = {}
+
+    def deliver(self, channel, text):
+        """Queues an answer for the channel and returns immediately."""
+        queue = self._queues.get(channel.id)
+        if queue is None:
+            queue = self._queues[channel.id] = asyncio.Queue()
+            bucket = self._buckets.setdefault(channel.id, TokenBucket(self.rate, self.burst))
+            self._workers[channel.id] = asyncio.get_running_loop().create_task(
+                self._worker(channel, queue, bucket)
+            )
+        for payload in build_messages(text, use_embeds=can_embed(channel)):
+            queue.put_nowait(payload)
+
+    async def _worker(self, channel, queue, bucket):
+        try:
+            while True:
+                try:
+                    content, embeds = await asyncio.wait_for(queue.get(), WORKER_IDLE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    if queue.empty():
+                        return
+                    continue
+                try:
+                    await self._send(channel, bucket, content, embeds)
+                except Exception as e:
+                    print(f"Error sending message to channel {channel.id}: {e}")
+        finally:
+            # No await between here and the removal, so deliver() cannot slip in;
+            # the next deliver() for this channel starts a fresh worker
+            if self._queues.get(channel.id) is queue:
+                del self._queues[channel.id]
+            self._workers.pop(channel.id, None)
+
+    async def _send(self, channel, bucket, content, embeds):
+        await bucket.acquire()
+        try:
+            # discord.py already waits out 429s inside send(); the bucket keeps us under the limit
+            await channel.send(content=content, embeds=embeds)
+        except discord.HTTPException as e:
+            if not embeds:
+                raise
+            # e.g. Embed Links was revoked after deliver(): resend the pages as plain text
+            print(f"Embed send failed in channel {channel.id} ({e}), falling back to plain text")
+            for embed in embeds:
+                for part in split_message(embed.description, MAX_MESSAGE_CHARS):
+                    await bucket.acquire()
+                    await channel.send(content=part)
@@ -0,0 +1,93 @@
+# policy.py
+
+import re
+
+from config import (
+    MIN_SIMILARITY, LOW_CONFIDENCE_SIMILARITY, CLEAR_MARGIN, CLOSE_MARGIN,
+    MAX_CONTEXT_CHUNKS, MAX_NUM_PREDICT, MAX_INFERENCE_TIMEOUT, MIN_INFERENCE_TIMEOUT
+)
+
+NOT_IN_KB_REPLY = (
+    "I couldn't find anything about that in my knowledge base. "
+    "I can only answer questions about the Azwaj (Wives of the Prophet), "
+    "so please try rephrasing or ask about one of them."
+)
+
+# Generation ends at the answer boundary instead of running on into a new "turn"
+STOP_SEQUENCES = ["\nQuestion:", "\nContext:", "\nUser:"]
+
+# Checked in this order: a question that asks for detail wins over a "who/when" opener
+DETAILED_PATTERN = re.compile(
+    r"\b(explain|describe|tell me about|why|discuss|elaborate|in detail|"
+    r"life of|biography|story|virtues|compare|difference)\b",
+    re.IGNORECASE
+)
+SHORT_PATTERN = re.compile(
+    r"^\s*(who|whose|whom|when|where|which|how many|how old|name|"
+    r"what (?:was|is) (?:the |her )?name)\b",
+    re.IGNORECASE
+)
+
+# question type -> (num_predict, context chunks)
+QUESTION_BUDGETS = {
+    "short": (150, 2),
+    "general": (300, 3),
+    "detailed": (MAX_NUM_PREDICT, 4),
+}
+
+
+class GenerationPlan:
+    """How (and whether) to call the LLM for one question."""
+
+    def __init__(self, question_type, answerable, num_predict=0, num_chunks=0, timeout=0):
+        self.question_type = question_type
+        self.answerable = answerable
+        self.num_predict = num_predict
+        self.num_chunks = num_chunks
+        self.timeout = timeout
+
+    def __repr__(self):
+        return (f"GenerationPlan(type={self.question_type}, answerable={self.answerable}, "
+                f"num_predict={self.num_predict}, chunks={self.num_chunks}, timeout={self.timeout})")
+
+
+def classify_question(users_query):
+    """Returns 'detailed', 'short' or 'general' based on how the question is phrased."""
+    if DETAILED_PATTERN.search(users_query):
+        return "detailed"
+    if SHORT_PATTERN.search(users_query):
+        return "short"
+    return "general"
+
+
+def plan_generation(users_query, top_scores):
+    """
+    Picks the generation budget from the question type and retrieval confidence.
+
+    top_scores are the similarity scores of the retrieved chunks, best first.
+    Below MIN_SIMILARITY the question is treated as off-topic and the LLM is skipped.
+    """
+    question_type = classify_question(users_query)
+    top = float(top_scores[0]) if len(top_scores) else 0.0
+    if top < MIN_SIMILARITY:
+        return GenerationPlan(question_type, answerable=False)
+
+    num_predict, num_chunks = QUESTION_BUDGETS[question_type]
+
+    # One chunk clearly wins -> fewer chunks; near-ties -> widen the context
+    margin = top - float(top_scores[1]) if len(top_scores) > 1 else top
+    if margin >= CLEAR_MARGIN:
+        num_chunks -= 1
+    elif margin < CLOSE_MARGIN:
+        num_chunks += 1
+
+    # Weak match: keep the answer short rather than padding it out
+    if top < LOW_CONFIDENCE_SIMILARITY:
+        num_predict = int(num_predict * 0.6)
+
+    # Never include chunks that are themselves below the relevance threshold
+    relevant = sum(1 for score in top_scores if score >= MIN_SIMILARITY)
+    num_chunks = max(1, min(num_chunks, relevant, MAX_CONTEXT_CHUNKS))
+
+    timeout = max(MIN_INFERENCE_TIMEOUT, int(MAX_INFERENCE_TIMEOUT * num_predict / MAX_NUM_PREDICT))
+    return GenerationPlan(question_type, True, num_predict, num_chunks, timeout)
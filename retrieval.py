@@ -1,30 +1,209 @@
 # retrieval.py
 
+import os
+import json
+import threading
 import requests
 import joblib
 import numpy as np
 from sklearn.metrics.pairwise import cosine_similarity
 import pandas as pd 
 
+from collections import OrderedDict
+
 from config import (
     OLLAMA_EMBED_URL, OLLAMA_GENERATE_URL, JOB_LIB_PATH, 
-    EMBEDDING_MODEL, LLM_MODEL
+    EMBEDDING_MODEL, LLM_MODEL, QUERY_CACHE_SIZE, CACHE_ANSWERS,
+    MAX_CONTEXT_CHUNKS, MAX_NUM_PREDICT, MAX_INFERENCE_TIMEOUT
 )
+from policy import plan_generation, NOT_IN_KB_REPLY, STOP_SEQUENCES
 
-# --- Global Data Variable ---
+# --- Global Data Variables ---
+# DF is kept for backwards compatibility; queries read the KB snapshot instead.
 DF = None
+KB = None
+
+# Serialises reloads so two rebuilds never race each other for the swap.
+_RELOAD_LOCK = threading.Lock()
+# Callbacks run after every successful swap (used to drop dependent caches).
+_RELOAD_HOOKS = []
+# mtime of the last file that failed validation, so the watcher does not retry it forever
+_FAILED_MTIME = None
+
+REQUIRED_COLUMNS = ("content", "chunk_embeddings")
+
+
+class KnowledgeBase:
+    """Immutable snapshot of the vector store: dataframe, embedding matrix and source mtime."""
+
+    def __init__(self, df, path, mtime):
+        self.df = df
+        self.path = path
+        self.mtime = mtime
+        # Stack the embeddings once per snapshot instead of once per query
+        self.embeddings = np.vstack(df["chunk_embeddings"].values)
+        # Assigned under _RELOAD_LOCK when the snapshot is swapped in
+        self.version = None
+
+
+def build_knowledge_base(path=JOB_LIB_PATH):
+    """Loads and validates a joblib file into a new KnowledgeBase without touching the live one."""
+    # Read the mtime before loading: if the file is replaced mid-load, the
+    # snapshot looks stale and the watcher picks up the new file next time
+    mtime = os.path.getmtime(path)
+    df = joblib.load(path)
+    if not isinstance(df, pd.DataFrame):
+        raise ValueError(f"{path} does not contain a DataFrame.")
+    missing = [col for col in REQUIRED_COLUMNS if col not in df.columns]
+    if missing:
+        raise ValueError(f"{path} is missing columns: {missing}")
+    if df.empty:
+        raise ValueError(f"{path} contains no chunks.")
+    kb = KnowledgeBase(df, path, mtime)
+    if kb.embeddings.ndim != 2 or kb.embeddings.shape[0] != len(df):
+        raise ValueError(f"{path} has inconsistent embedding dimensions.")
+    if KB is not None and kb.embeddings.shape[1] != KB.embeddings.shape[1]:
+        raise ValueError(
+            f"{path} embedding size {kb.embeddings.shape[1]} does not match "
+            f"the live index ({KB.embeddings.shape[1]}). Was a different model used?"
+        )
+    return kb
+
+
+def register_reload_hook(hook):
+    """Registers a zero-argument callable to run after the knowledge base is swapped."""
+    _RELOAD_HOOKS.append(hook)
+    return hook
+
+
+def _swap_in(new_kb):
+    """Publishes a new snapshot. Caller must hold _RELOAD_LOCK."""
+    global DF, KB
+    new_kb.version = (KB.version + 1) if KB is not None else 1
+    # A single reference assignment is atomic, readers never see a half-built index
+    KB = new_kb
+    DF = new_kb.df
+
 
 def load_data():
     """Loads the joblib file into a global DataFrame."""
     global DF
-    try:
-        DF = joblib.load(JOB_LIB_PATH)
-        print("Joblib data loaded successfully.")
-        return DF
-    except FileNotFoundError:
-        print(f"Error: {JOB_LIB_PATH} not found. Please check the file path.")
-        DF = None
-        return None
+    with _RELOAD_LOCK:
+        try:
+            _swap_in(build_knowledge_base(JOB_LIB_PATH))
+            print("Joblib data loaded successfully.")
+            return DF
+        except FileNotFoundError:
+            print(f"Error: {JOB_LIB_PATH} not found. Please check the file path.")
+            DF = None
+            return None
+        except ValueError as e:
+            print(f"Error: {e}")
+            DF = None
+            return None
+
+
+def reload_data(path=JOB_LIB_PATH):
+    """
+    Rebuilds the knowledge base and swaps it in atomically.
+
+    Queries already running keep the snapshot they started with; the old
+    snapshot is freed once the last of them finishes. Returns (ok, message).
+    """
+    global _FAILED_MTIME
+    with _RELOAD_LOCK:
+        attempted_mtime = os.path.getmtime(path) if os.path.exists(path) else None
+        try:
+            new_kb = build_knowledge_base(path)
+        except FileNotFoundError:
+            return False, f"{path} not found. Keeping the current knowledge base."
+        except Exception as e:
+            _FAILED_MTIME = attempted_mtime
+            return False, f"Reload failed, keeping the current knowledge base: {e}"
+
+        _swap_in(new_kb)
+
+        for hook in list(_RELOAD_HOOKS):
+            try:
+                hook()
+            except Exception as e:
+                print(f"Error in reload hook {hook!r}: {e}")
+
+    message = f"Knowledge base v{new_kb.version} loaded: {len(new_kb.df)} chunks."
+    print(message)
+    return True, message
+
+
+def knowledge_base_changed():
+    """Returns True when the joblib file on disk is newer than the live snapshot."""
+    if not os.path.exists(JOB_LIB_PATH):
+        return False
+    mtime = os.path.getmtime(JOB_LIB_PATH)
+    if mtime == _FAILED_MTIME:
+        return False
+    return KB is None or mtime != KB.mtime
+
+
+# --- Query Caches ---
+class LRUCache:
+    """Small thread-safe LRU cache shared by the live query path and the warm-up job."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._data:
+                return None
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+# Embeddings only depend on the model, so they survive a knowledge base reload
+EMBEDDING_CACHE = LRUCache(QUERY_CACHE_SIZE)
+# Keyed by (kb.version, query): top chunk indices and scores
+RETRIEVAL_CACHE = LRUCache(QUERY_CACHE_SIZE)
+# Keyed by (kb.version, query): final answers, only used when CACHE_ANSWERS is on
+ANSWER_CACHE = LRUCache(QUERY_CACHE_SIZE)
+
+
+def normalize_query(users_query):
+    """Cache key for a question: lowercased with collapsed whitespace."""
+    return " ".join(users_query.lower().split())
+
+
+@register_reload_hook
+def clear_knowledge_base_caches():
+    """Drops everything that was computed against the previous knowledge base."""
+    RETRIEVAL_CACHE.clear()
+    ANSWER_CACHE.clear()
+
+
+# --- Live Traffic Tracking ---
+# Number of user queries currently being answered; background jobs back off while > 0
+_ACTIVE_QUERIES = 0
+_ACTIVE_LOCK = threading.Lock()
+
+
+def active_queries():
+    """Returns how many live user queries are in progress."""
+    return _ACTIVE_QUERIES
 
 # Load data on import
 load_data()
@@ -33,7 +212,7 @@ load_data()
 
 def create_embedding(input_list):
     """Synchronous function to generate embeddings using Ollama."""
-    if not input_list or DF is None:
+    if not input_list or KB is None:
         return None
     try:
         r = requests.post(OLLAMA_EMBED_URL, json={
@@ -46,62 +225,89 @@ def create_embedding(input_list):
         print(f"Error creating embedding: {e}")
         return None
 
-def inference(prompt):
-    """Synchronous function to generate response using Ollama."""
+INFERENCE_FAILED = "Sorry, I couldn't connect to the Ollama server or the request timed out."
+INFERENCE_CANCELLED = "Error: Generation was cancelled."
+
+def _stream_inference(payload, timeout, cancel):
+    """Streams a generation and drops the connection (which stops Ollama) as soon as cancel() is True."""
+    with requests.post(OLLAMA_GENERATE_URL, json=payload, timeout=timeout, stream=True) as r:
+        r.raise_for_status()
+        parts = []
+        for line in r.iter_lines():
+            if cancel():
+                return INFERENCE_CANCELLED
+            if not line:
+                continue
+            data = json.loads(line)
+            parts.append(data.get("response", ""))
+            if data.get("done"):
+                break
+        return "".join(parts)
+
+def inference(prompt, num_predict=MAX_NUM_PREDICT, stop=None, timeout=MAX_INFERENCE_TIMEOUT, cancel=None):
+    """
+    Synchronous function to generate response using Ollama.
+
+    When cancel is given the response is streamed and abandoned once cancel() returns True.
+    """
     if not OLLAMA_GENERATE_URL:
         return "OLLAMA_URL is not configured."
+    payload = {
+        "model" : LLM_MODEL,
+        "prompt": prompt,
+        "stream" : cancel is not None,
+        "options": {
+            "num_predict": num_predict,
+            "stop": stop or [],
+        }
+    }
     try:
-        r = requests.post(OLLAMA_GENERATE_URL, json = {
-            "model" : LLM_MODEL,
-            "prompt": prompt,
-            "stream" : False,
-            "options": {                # <<< Naya Option
-                "num_predict": 400    # <<< Naya Limit
-            }
-        }, timeout=170) # Ensure this timeout is still 300
+        if cancel is not None:
+            return _stream_inference(payload, timeout, cancel)
+        r = requests.post(OLLAMA_GENERATE_URL, json=payload, timeout=timeout)
         r.raise_for_status()
         response = r.json()
         print(f"--- Ollama Raw Response: {response}") 
         return response.get("response", "Error: No 'response' field in Ollama output.")
-    except requests.exceptions.RequestException as e:
+    except (requests.exceptions.RequestException, ValueError) as e:
         print(f"Error during Ollama inference: {e}")
-        return "Sorry, I couldn't connect to the Ollama server or the request timed out."
+        return INFERENCE_FAILED
 
 
-def perform_rag_retrieval(users_query):
-    """Performs the full RAG process (Retrieval + Generation)."""
-    
-    if DF is None:
-        return "The knowledge base is not loaded."
+def embed_query(users_query):
+    """Returns the embedding for a single question, using the embedding cache."""
+    key = normalize_query(users_query)
+    cached = EMBEDDING_CACHE.get(key)
+    if cached is not None:
+        return cached
+
+    embedding_list = create_embedding([users_query])
+    if embedding_list is None:
+        return None
+    EMBEDDING_CACHE.put(key, embedding_list[0])
+    return embedding_list[0]
 
-    # 1. Get Embedding
-    questions_embedding_list = create_embedding([users_query])
-    if questions_embedding_list is None:
-        return "Failed to create embedding. Is Ollama running and the bge-m3 model available?"
-        
-    questions_embedding = questions_embedding_list[0]
-    
-    # 2. Retrieval 
-    stored_embeddings = np.vstack(DF["chunk_embeddings"].values)
-    similarities = cosine_similarity(stored_embeddings, [questions_embedding]).flatten()
-    
-    # Keep retrieval count at 5 for better context coverage
-    top_indices = np.argsort(similarities)[-3:][::-1] 
-    
-    # --- Debugging Output ---
-    print(f"\n[RAG Debug] Query: '{users_query}'")
-    print(f"Top 3 Similarity Scores: {similarities[top_indices]}")
-    
-    context_chunks = DF.iloc[top_indices]["content"].values
-    context = "\n\n".join(context_chunks)
-    print("--- Retrieved Context Chunks ---")
-    for i, chunk in enumerate(context_chunks):
-        print(f"Chunk {i+1} (Score: {similarities[top_indices][i]:.4f}):\n{chunk[:100]}...\n---")
-    # ---------------------------
 
-    # 3. Prompt Construction: IMPROVED INSTRUCTIONS FOR ACCURACY AND DETAIL
-   # In retrieval.py, inside the perform_rag_retrieval function (Step 3: Prompt Construction)
+def retrieve(users_query, kb, top_k=MAX_CONTEXT_CHUNKS):
+    """Returns (top_indices, top_scores) for the question against a snapshot, or None if embedding failed."""
+    key = (kb.version, top_k, normalize_query(users_query))
+    cached = RETRIEVAL_CACHE.get(key)
+    if cached is not None:
+        return cached
 
+    questions_embedding = embed_query(users_query)
+    if questions_embedding is None:
+        return None
+
+    similarities = cosine_similarity(kb.embeddings, [questions_embedding]).flatten()
+    top_indices = np.argsort(similarities)[-top_k:][::-1]
+    result = (top_indices, similarities[top_indices])
+    RETRIEVAL_CACHE.put(key, result)
+    return result
+
+
+def build_prompt(context, users_query):
+    """Builds the guarded RAG prompt: IMPROVED INSTRUCTIONS FOR ACCURACY AND DETAIL"""
     prompt = f"""
     You are an expert on the Azwaj (Wives of the Prophet). Your goal is to be highly accurate.
 
@@ -123,6 +329,71 @@ def perform_rag_retrieval(users_query):
 
     Context:\n\n{context}\n\nQuestion: {users_query}\n\nAnswer:
     """
+    return prompt
+
+
+def answer_query(users_query, max_timeout=None, cancel=None):
+    """
+    Retrieval + Generation without live-traffic bookkeeping (also used by the warm-up job).
+
+    max_timeout caps the inference timeout and cancel aborts the generation,
+    so background callers can stay inside their budget and give way to users.
+    """
+    
+    # Pin the current snapshot so a concurrent reload cannot change it mid-query
+    kb = KB
+    if kb is None:
+        return "The knowledge base is not loaded."
+
+    answer_key = (kb.version, normalize_query(users_query))
+    if CACHE_ANSWERS:
+        cached = ANSWER_CACHE.get(answer_key)
+        if cached is not None:
+            print(f"\n[RAG Debug] Answer cache hit for: '{users_query}'")
+            return cached
+
+    # 1. Get Embedding + 2. Retrieval (both cached)
+    retrieved = retrieve(users_query, kb)
+    if retrieved is None:
+        return "Failed to create embedding. Is Ollama running and the bge-m3 model available?"
+    top_indices, top_scores = retrieved
+    
+    # --- Debugging Output ---
+    print(f"\n[RAG Debug] Query: '{users_query}'")
+    print(f"Top Similarity Scores: {top_scores}")
+
+    # Decide whether to call the LLM at all, and with how much budget
+    plan = plan_generation(users_query, top_scores)
+    print(f"[RAG Debug] {plan}")
+    if not plan.answerable:
+        return NOT_IN_KB_REPLY
+    top_indices = top_indices[:plan.num_chunks]
+    
+    context_chunks = kb.df.iloc[top_indices]["content"].values
+    context = "\n\n".join(context_chunks)
+    print("--- Retrieved Context Chunks ---")
+    for i, chunk in enumerate(context_chunks):
+        print(f"Chunk {i+1} (Score: {top_scores[i]:.4f}):\n{chunk[:100]}...\n---")
+    # ---------------------------
+
+    # 3. Prompt Construction
+    prompt = build_prompt(context, users_query)
     
     # 4. Generation (Inference)
-    return inference(prompt)
+    timeout = plan.timeout if max_timeout is None else min(plan.timeout, max_timeout)
+    answer = inference(prompt, num_predict=plan.num_predict, stop=STOP_SEQUENCES, timeout=timeout, cancel=cancel)
+    if CACHE_ANSWERS and answer != INFERENCE_FAILED and not answer.startswith("Error"):
+        ANSWER_CACHE.put(answer_key, answer)
+    return answer
+
+
+def perform_rag_retrieval(users_query):
+    """Performs the full RAG process (Retrieval + Generation)."""
+    global _ACTIVE_QUERIES
+    with _ACTIVE_LOCK:
+        _ACTIVE_QUERIES += 1
+    try:
+        return answer_query(users_query)
+    finally:
+        with _ACTIVE_LOCK:
+            _ACTIVE_QUERIES -= 1
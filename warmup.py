@@ -0,0 +1,141 @@
+# warmup.py
+
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import retrieval
+from config import (
+    QUERY_LOG_PATH, CACHE_ANSWERS, WARMUP_MAX_QUERIES,
+    WARMUP_TIME_BUDGET, WARMUP_CONCURRENCY, WARMUP_HALF_LIFE_DAYS
+)
+
+# Seconds to sleep between checks while live queries are running
+YIELD_SLEEP = 0.5
+
+_LOG_LOCK = threading.Lock()
+# One warm-up at a time; a run requested meanwhile (e.g. after a reload) waits its turn
+_WARMUP_LOCK = threading.Lock()
+
+
+def log_query(users_query, path=QUERY_LOG_PATH):
+    """Appends a user question to the query log (one JSON object per line)."""
+    line = json.dumps({"query": users_query, "ts": time.time()}, ensure_ascii=False)
+    try:
+        with _LOG_LOCK, open(path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+    except OSError as e:
+        print(f"Error writing query log: {e}")
+
+
+def load_query_log(path=QUERY_LOG_PATH):
+    """Reads (query, timestamp) pairs from the query log, skipping malformed lines."""
+    entries = []
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    query = record["query"].strip()
+                    ts = float(record.get("ts", 0))
+                except (ValueError, KeyError, TypeError, AttributeError):
+                    continue
+                if query:
+                    entries.append((query, ts))
+    except FileNotFoundError:
+        pass
+    return entries
+
+
+def rank_queries(entries, now=None, half_life_days=WARMUP_HALF_LIFE_DAYS):
+    """
+    Ranks questions by frequency and recency.
+
+    Every occurrence adds 0.5 ** (age / half_life) to its question's score,
+    so a question asked often and lately comes first. Returns the most
+    recent wording of each question, best first.
+    """
+    now = time.time() if now is None else now
+    half_life = half_life_days * 86400
+    scores = {}
+    latest = {}
+    for query, ts in entries:
+        key = retrieval.normalize_query(query)
+        age = max(0.0, now - ts)
+        scores[key] = scores.get(key, 0.0) + 0.5 ** (age / half_life)
+        if key not in latest or ts >= latest[key][1]:
+            latest[key] = (query, ts)
+    ranked = sorted(scores, key=scores.get, reverse=True)
+    return [latest[key][0] for key in ranked]
+
+
+def run_warmup(max_queries=WARMUP_MAX_QUERIES, time_budget=WARMUP_TIME_BUDGET,
+               concurrency=WARMUP_CONCURRENCY):
+    """
+    Pre-computes embeddings and retrieval results (and answers when
+    CACHE_ANSWERS is on) for the top questions in the query log.
+
+    Stops at the time budget and backs off whenever a live query is running.
+    Returns the number of questions warmed.
+    """
+    with _WARMUP_LOCK:
+        return _run_warmup(max_queries, time_budget, concurrency)
+
+
+def _run_warmup(max_queries, time_budget, concurrency):
+    if retrieval.KB is None or max_queries <= 0:
+        return 0
+
+    queries = rank_queries(load_query_log())[:max_queries]
+    if not queries:
+        return 0
+
+    started = time.monotonic()
+    deadline = started + time_budget
+
+    def wait_for_idle():
+        # Yield to live traffic: never compete with a user for Ollama
+        while retrieval.active_queries() > 0:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(YIELD_SLEEP)
+        return time.monotonic() < deadline
+
+    def should_stop():
+        return retrieval.active_queries() > 0 or time.monotonic() >= deadline
+
+    def warm_retrieval(query):
+        kb = retrieval.KB
+        if kb is None or not wait_for_idle():
+            return False
+        return retrieval.retrieve(query, kb) is not None
+
+    # Embeddings and retrieval are short requests, so these run in parallel
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        warmed = sum(executor.map(warm_retrieval, queries))
+
+    if CACHE_ANSWERS:
+        # Generations are long: one at a time, aborted the moment a live query
+        # arrives (or the budget runs out), then retried once traffic clears
+        answered = 0
+        for query in queries:
+            while wait_for_idle():
+                answer = retrieval.answer_query(
+                    query, max_timeout=deadline - time.monotonic(), cancel=should_stop
+                )
+                if answer != retrieval.INFERENCE_CANCELLED:
+                    answered += answer != retrieval.INFERENCE_FAILED
+                    break
+            else:
+                break
+        print(f"[Warmup] Pre-generated {answered}/{len(queries)} answers")
+
+    print(f"[Warmup] Warmed {warmed}/{len(queries)} queries in {time.monotonic() - started:.1f}s")
+    return warmed
+
+
+@retrieval.register_reload_hook
+def rewarm_after_reload():
+    """A reload clears the retrieval/answer caches; warm them again in the background."""
+    threading.Thread(target=run_warmup, name="warmup-after-reload", daemon=True).start()